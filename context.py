@@ -1,16 +1,19 @@
 """Contextual data for personalization and parameter inference."""
 
-MOCK_USER_INFO = {
+from types import MappingProxyType
+
+# Read-only views: these are baked into the shared planner prompt prefix
+MOCK_USER_INFO = MappingProxyType({
     "user_id": "std-48293",
     "name": "Student Example",
     "subject": "Biology",
     "grade_level": "10",
     "emotional_state": "Confused"
-}
+})
 
-MOCK_STUDENT_CONTEXT = {
+MOCK_STUDENT_CONTEXT = MappingProxyType({
     "last_topic": "Photosynthesis",
     "mastery_score": 4,
     "preferred_style": "Socratic",
     "subject": "Biology"
-}
+})
@@ -0,0 +1,11 @@
+"""Production Gunicorn config: `gunicorn -c gunicorn.conf.py main:app`."""
+
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+
+# Uvicorn workers pick up uvloop + httptools automatically when installed
+worker_class = "uvicorn.workers.UvicornWorker"
+workers = int(os.getenv("WEB_CONCURRENCY", 2 * multiprocessing.cpu_count() + 1))
+keepalive = 5
@@ -1,27 +1,65 @@
 """FastAPI interface for YoLearn Orchestrator."""
 
+import os
+import sys
+from contextlib import asynccontextmanager
+
 from dotenv import load_dotenv
 load_dotenv()
 
 from fastapi import FastAPI, Query
-from orchestrator_graph import run_orchestrator_turn
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel, Field
+from orchestrator_graph import arun_orchestrator_turn, awarm_up
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Pay Gemini's cold start (TCP/TLS, auth, tool schemas) before serving; ORCH_WARMUP=0 skips it
+    if os.getenv("ORCH_WARMUP", "1") != "0":
+        await awarm_up(timeout=float(os.getenv("ORCH_WARMUP_TIMEOUT", "10")))
+    yield
+
 
 app = FastAPI(
     title="YoLearn AI Tutor Orchestrator",
     description="LangGraph + LangChain autonomous tutor middleware",
-    version="1.0"
+    version="1.0",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan,
 )
 
+# Messages are kept as keys in the per-worker planner caches, so their size is capped
+MAX_MESSAGE_LENGTH = 2000
+
+class OrchestrateRequest(BaseModel):
+    message: str = Field(..., max_length=MAX_MESSAGE_LENGTH, description="Student message")
+
+
 @app.get("/")
 def root():
     return {"message": "YoLearn Orchestrator is running 🚀"}
 
 @app.post("/api/orchestrate")
-async def orchestrate(message: str = Query(..., description="Student message")):
-    result = run_orchestrator_turn(message)
+async def orchestrate(
+    request: OrchestrateRequest,
+    debug: bool = Query(False, description="Include raw graph state and LLM output"),
+):
+    result = await arun_orchestrator_turn(request.message, debug=debug)
     return result
 
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run("main:app", host="127.0.0.1", port=8000, reload=True)
+
+    # Dev server; for production use gunicorn with gunicorn.conf.py (multi-worker)
+    workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+    uvicorn.run(
+        "main:app",
+        host="127.0.0.1",
+        port=int(os.getenv("PORT", "8000")),
+        loop="asyncio" if sys.platform == "win32" else "uvloop",
+        http="httptools",
+        workers=workers,
+        reload=workers == 1,
+    )
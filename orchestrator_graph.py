@@ -2,15 +2,27 @@
 import os
 import re
 import json
-from typing import Dict, Any, TypedDict, Optional
+import asyncio
+import atexit
+import logging
+import orjson
+import queue
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from logging.handlers import QueueHandler, QueueListener
+from typing import Callable, Dict, Any, List, Set, Tuple, TypedDict, Optional
 from dotenv import load_dotenv
 
 # LangChain / LangGraph imports
 from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain.agents import create_tool_calling_agent, AgentExecutor
-from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain_core.messages import SystemMessage
+from langchain_core.messages import SystemMessage, HumanMessage, ToolCall
+from langchain_core.tools import StructuredTool
 from langgraph.graph import StateGraph, END
+from langgraph.utils import RunnableCallable
+from pydantic import Field, create_model
 
 # Project-local imports
 from tools import TOOL_MAP, LC_TOOLS
@@ -18,6 +30,23 @@ from context import MOCK_USER_INFO, MOCK_STUDENT_CONTEXT
 
 load_dotenv()
 
+# ---------------------------------------------
+# Logging
+# ---------------------------------------------
+# Request paths only enqueue records; a background listener thread does the stream I/O.
+# Override handlers/levels for the "orch" logger via `uvicorn --log-config`.
+logger = logging.getLogger("orch")
+if not logger.handlers:
+    _log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    _log_stream = logging.StreamHandler()
+    _log_stream.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    _log_listener = QueueListener(_log_queue, _log_stream)
+    _log_listener.start()
+    atexit.register(_log_listener.stop)
+    logger.addHandler(QueueHandler(_log_queue))
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
 # ---------------------------------------------
 # Env check
 # ---------------------------------------------
@@ -27,11 +56,15 @@ if not os.getenv("GOOGLE_API_KEY"):
 # ---------------------------------------------
 # System Prompt for Planner Agent
 # ---------------------------------------------
-SYSTEM_PROMPT = f"""
+# Shared content goes first and stays byte-identical across every planner call
+# (single + batched); only the short per-request suffix and the student message vary.
+# Nothing is cached today (the prefix is below Gemini's minimum cacheable size and no
+# CachedContent is set up) — the prefix is just kept stable so caching can be added later.
+STATIC_PREFIX = f"""
 You are the YoLearn Autonomous AI Tutor Orchestrator.
 
 Your ONLY task:
-→ Select one correct tool and return a structured JSON specifying the tool and its parameters.
+→ Select the correct tool and call it with all of its parameters.
 
 Available tools:
 - note_maker(topic: str, note_taking_style: str, subject: str, include_examples: bool, include_analogies: bool)
@@ -39,31 +72,274 @@ Available tools:
 - concept_explainer(concept_to_explain: str, desired_depth: str, current_topic: str)
 
 Context:
-User Info: {MOCK_USER_INFO}
-Student Context: {MOCK_STUDENT_CONTEXT}
+User Info: {dict(MOCK_USER_INFO)}
+Student Context: {dict(MOCK_STUDENT_CONTEXT)}
 
 Rules:
-- Output ONLY valid JSON (no extra text).
-- Return exactly ONE tool call.
+- Respond ONLY with tool calls (no extra text).
 - If any parameter is missing, infer a reasonable default.
 """
 
+SINGLE_CALL_SUFFIX = "Make exactly ONE tool call for this student message:\n"
+
+STATIC_SYSTEM_MESSAGE = SystemMessage(content=STATIC_PREFIX)
+
+
+def _single_call_messages(user_input: str) -> List[Any]:
+    return [STATIC_SYSTEM_MESSAGE, HumanMessage(content=SINGLE_CALL_SUFFIX + user_input)]
+
 # ---------------------------------------------
-# Initialize LLM and Agent
+# Initialize LLM
 # ---------------------------------------------
 llm = ChatGoogleGenerativeAI(model="gemini-2.0-flash", temperature=0.0)
 
-prompt = ChatPromptTemplate.from_messages(
-    [
-        SystemMessage(content=SYSTEM_PROMPT),
-        MessagesPlaceholder(variable_name="agent_scratchpad"),
-        MessagesPlaceholder(variable_name="intermediate_steps"),
-        ("human", "{input}"),
-    ]
-)
+# Forced function calling (mode ANY): Gemini can only answer with calls to our tools,
+# with arguments constrained by each tool's args_schema — no free-form JSON to parse.
+structured_llm = llm.bind_tools(LC_TOOLS, tool_choice="any")
 
-_agent = create_tool_calling_agent(llm, LC_TOOLS, prompt)
-_agent_executor = AgentExecutor(agent=_agent, tools=LC_TOOLS, verbose=False)
+
+# ---------------------------------------------
+# Planner Batcher (coalesces concurrent async planner calls)
+# ---------------------------------------------
+# Opt-in: one prompt then carries several students' messages; set ORCH_PLANNER_BATCH=1 to enable
+ORCH_PLANNER_BATCH = os.getenv("ORCH_PLANNER_BATCH") == "1"
+
+
+# Batched calls carry the number of the message they answer, so results are routed by that
+# index rather than by position; the field is declared to Gemini only and stripped before use.
+def _indexed_tool(tool: StructuredTool) -> StructuredTool:
+    schema = create_model(
+        f"Batched{tool.args_schema.__name__}",
+        __base__=tool.args_schema,
+        message_index=(int, Field(..., description="Number of the student message this call answers")),
+    )
+    return StructuredTool.from_function(
+        func=tool.func, name=tool.name, description=tool.description, args_schema=schema
+    )
+
+
+batch_llm = llm.bind_tools([_indexed_tool(t) for t in LC_TOOLS], tool_choice="any")
+
+
+class PlannerBatcher:
+    """Collects student messages arriving within `max_wait` seconds (up to `max_batch`)
+    and plans them all with a single Gemini call making one tool call per message.
+
+    Each call is routed by the `message_index` it echoes; messages left without exactly one
+    call (missing or duplicate index) are re-planned with their own call."""
+
+    def __init__(self, chat_model: Any, max_batch: int = 8, max_wait: float = 0.02):
+        self.chat_model = chat_model
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._inflight: Set[asyncio.Task] = set()
+
+    async def submit(self, user_input: str) -> ToolCall:
+        """Queue one message and wait for its tool call."""
+        loop = asyncio.get_running_loop()
+        if self._worker is None or self._worker.done() or self._loop is not loop:
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._worker = loop.create_task(self._collect())
+
+        future = loop.create_future()
+        await self._queue.put((user_input, future))
+        return await future
+
+    async def _collect(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            # Dispatch without blocking collection of the next batch
+            task = loop.create_task(self._dispatch(batch))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _dispatch(self, batch: List[Tuple[str, asyncio.Future]]) -> None:
+        try:
+            response = await self.chat_model.ainvoke(
+                [
+                    STATIC_SYSTEM_MESSAGE,
+                    HumanMessage(content=self._batch_prompt([msg for msg, _ in batch])),
+                ]
+            )
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        by_index: Dict[int, List[ToolCall]] = {}
+        for tool_call in response.tool_calls:
+            index = self._pop_message_index(tool_call)
+            if index is not None:
+                by_index.setdefault(index, []).append(tool_call)
+
+        unmatched = []
+        for index, (message, future) in enumerate(batch, 1):
+            calls = by_index.get(index, [])
+            if len(calls) != 1:
+                unmatched.append((message, future))
+            elif not future.done():
+                future.set_result(calls[0])
+
+        if unmatched:
+            logger.info("[Planner] Re-planning %d of %d batched messages individually.", len(unmatched), len(batch))
+            await asyncio.gather(*(self._dispatch_one(message, future) for message, future in unmatched))
+
+    async def _dispatch_one(self, message: str, future: asyncio.Future) -> None:
+        try:
+            response = await self.chat_model.ainvoke(_single_call_messages(message))
+            if not response.tool_calls:
+                raise ValueError("LLM failed to produce structured tool call.")
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+            return
+
+        tool_call = response.tool_calls[0]
+        self._pop_message_index(tool_call)
+        if not future.done():
+            future.set_result(tool_call)
+
+    @staticmethod
+    def _pop_message_index(tool_call: ToolCall) -> Optional[int]:
+        # Gemini returns numbers as floats (1.0); anything non-integral counts as missing
+        index = tool_call["args"].pop("message_index", None)
+        if isinstance(index, (int, float)) and not isinstance(index, bool) and float(index).is_integer():
+            return int(index)
+        return None
+
+    @staticmethod
+    def _batch_prompt(messages: List[str]) -> str:
+        numbered = "\n".join(f"{i}. {json.dumps(m)}" for i, m in enumerate(messages, 1))
+        return (
+            f"Make exactly {len(messages)} tool calls: ONE for EACH student message below, "
+            "planned independently. Set message_index in each call to the number of the "
+            "message it answers.\n\n"
+            f"{numbered}"
+        )
+
+
+planner_batcher = PlannerBatcher(batch_llm)
+
+
+# ---------------------------------------------
+# Plan Cache (exact LRU + optional GPTCache semantic tier)
+# ---------------------------------------------
+PLAN_CACHE_SIZE = 2048
+_WHITESPACE_RE = re.compile(r"\s+")
+
+# Values are (tool_name, orjson-encoded tool_args) so every hit hands out a fresh args dict
+_plan_cache: "OrderedDict[str, Tuple[str, bytes]]" = OrderedDict()
+_plan_cache_lock = threading.Lock()
+
+# GPTCache keeps its sqlite/faiss files under data_dir; each worker process gets its own
+# temporary directory (removed at exit) so gunicorn workers never share or clobber them
+_semantic_cache = None
+if os.getenv("ORCH_SEMANTIC_CACHE") == "1":
+    try:
+        from gptcache.adapter import api as _semantic_cache
+
+        _semantic_cache_dir = tempfile.mkdtemp(prefix="orch-semantic-cache-")
+        atexit.register(shutil.rmtree, _semantic_cache_dir, ignore_errors=True)
+        _semantic_cache.init_similar_cache(data_dir=_semantic_cache_dir)
+    except ImportError:
+        logger.warning("[PlanCache] ⚠️ ORCH_SEMANTIC_CACHE=1 but gptcache is not installed; using exact cache only.")
+        _semantic_cache = None
+    except Exception as e:
+        logger.warning("[PlanCache] ⚠️ Semantic cache failed to initialize (%s); using exact cache only.", e)
+        _semantic_cache = None
+
+
+def _normalize_message(user_input: str) -> str:
+    return _WHITESPACE_RE.sub(" ", user_input.strip().lower())
+
+
+def _exact_plan_get(key: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+    with _plan_cache_lock:
+        hit = _plan_cache.get(key)
+        if hit is not None:
+            _plan_cache.move_to_end(key)
+    if hit is None:
+        return None
+    name, args_json = hit
+    return name, orjson.loads(args_json)
+
+
+def _semantic_plan_get(key: str, user_input: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+    try:
+        answer = _semantic_cache.get(key)
+        if not answer:
+            return None
+        cached = orjson.loads(answer)
+    except Exception as e:
+        logger.warning("[PlanCache] ⚠️ Semantic lookup failed: %s", e)
+        return None
+
+    # A similar message's args (topic, count, depth, …) belong to that message: reuse only
+    # the tool choice and derive every argument from the current message with the rules
+    name = cached["tool_name"]
+    if name not in _RULE_ARG_BUILDERS:
+        return None
+    return name, _rule_tool_args(name, user_input)
+
+
+def _exact_plan_put(key: str, tool_name: str, tool_args: Dict[str, Any]) -> None:
+    args_json = orjson.dumps(tool_args)
+    with _plan_cache_lock:
+        _plan_cache[key] = (tool_name, args_json)
+        _plan_cache.move_to_end(key)
+        if len(_plan_cache) > PLAN_CACHE_SIZE:
+            _plan_cache.popitem(last=False)
+
+
+def _semantic_plan_put(key: str, tool_name: str) -> None:
+    try:
+        _semantic_cache.put(key, json.dumps({"tool_name": tool_name}))
+    except Exception as e:
+        logger.warning("[PlanCache] ⚠️ Semantic store failed: %s", e)
+
+
+def _plan_cache_get(key: str, user_input: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+    hit = _exact_plan_get(key)
+    if hit is None and _semantic_cache is not None:
+        hit = _semantic_plan_get(key, user_input)
+    return hit
+
+
+def _plan_cache_put(key: str, tool_name: str, tool_args: Dict[str, Any]) -> None:
+    _exact_plan_put(key, tool_name, tool_args)
+    if _semantic_cache is not None:
+        _semantic_plan_put(key, tool_name)
+
+
+# The semantic tier embeds the message and searches a vector index synchronously;
+# the async twins run it in a worker thread so the event loop keeps serving
+async def _aplan_cache_get(key: str, user_input: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+    hit = _exact_plan_get(key)
+    if hit is None and _semantic_cache is not None:
+        hit = await asyncio.to_thread(_semantic_plan_get, key, user_input)
+    return hit
+
+
+async def _aplan_cache_put(key: str, tool_name: str, tool_args: Dict[str, Any]) -> None:
+    _exact_plan_put(key, tool_name, tool_args)
+    if _semantic_cache is not None:
+        await asyncio.to_thread(_semantic_plan_put, key, tool_name)
 
 
 # ---------------------------------------------
@@ -71,6 +347,7 @@ _agent_executor = AgentExecutor(agent=_agent, tools=LC_TOOLS, verbose=False)
 # ---------------------------------------------
 class OrchestratorState(TypedDict, total=False):
     user_message: str
+    debug: Optional[bool]
     tool_name: Optional[str]
     tool_args: Optional[Dict[str, Any]]
     tool_output: Optional[Dict[str, Any]]
@@ -78,183 +355,359 @@ class OrchestratorState(TypedDict, total=False):
     final_response: Optional[str]
     llm_raw: Optional[str]
     fallback_used: Optional[bool]
+    cache_hit: Optional[bool]
+    fast_path: Optional[bool]
     error: Optional[str]
 
 
 # ---------------------------------------------
 # Rule-based Planner (fallback)
 # ---------------------------------------------
+# Intent → keyword table, scanned once per message (substring match on the lowercased text)
+_INTENT_KEYWORDS: Tuple[Tuple[str, Tuple[str, ...]], ...] = (
+    ("note", ("note", "summary", "outline", "study")),
+    ("card", ("flashcard", "quiz", "practice")),
+    ("explain", ("explain", "define", "describe", "clarify")),
+    ("basic", ("simple", "basic")),
+    ("adv", ("advanced", "detailed")),
+    ("conf", ("confuse",)),
+)
+# Only "N [practice] flashcards/cards/questions" is a count; other numbers ("World War 2") are part of the topic
+_COUNT_RE = re.compile(r"\b(\d{1,2})\s+(?:[a-z]+\s+)?(?:flash\s?cards?|cards?|questions?)\b")
+_TOOL_INTENTS = frozenset({"note", "card", "explain"})
+
+# Request phrasing around the topic: a leading verb phrase, else the first "on/about/regarding";
+# anything from a trailing "and include…"/"please…"/depth hint onwards is dropped
+_TOPIC_LEAD_RE = re.compile(
+    r"^(?:(?:please|can you|could you|would you|help me)\s+)*"
+    r"(?:explain|define|describe|clarify|summari[sz]e|(?:give me )?a summary of|summary of)\s+(?:to me\s+)?",
+    re.IGNORECASE,
+)
+_TOPIC_MARKER_RE = re.compile(r"\b(?:on|about|regarding)\s+", re.IGNORECASE)
+_TOPIC_TAIL_RE = re.compile(
+    r"(?:,?\s+(?:and\s+)?(?:include|including|please)\b.*|\s+(?:in simple terms|simply|in detail|in depth))?"
+    r"[\s.?!,]*$",
+    re.IGNORECASE,
+)
+
+
+def _scan_intents(s: str) -> Set[str]:
+    """Return the intent names whose keywords appear in the lowercased message."""
+    fired: Set[str] = set()
+    for intent, keywords in _INTENT_KEYWORDS:
+        for k in keywords:
+            if k in s:
+                fired.add(intent)
+                break
+    return fired
+
+
+def _extract_topic(user_input: str) -> Optional[str]:
+    """Topic phrase of a request ("Make 3 flashcards on osmosis" → "osmosis"); None if there is no clear one."""
+    text = user_input.strip()
+    m = _TOPIC_LEAD_RE.match(text) or _TOPIC_MARKER_RE.search(text)
+    if m is None:
+        return None
+    topic = text[m.end():]
+    topic = topic[: _TOPIC_TAIL_RE.search(topic).start()].strip()
+    return topic or None
+
+
 def rule_based_planner(user_input: str) -> Dict[str, Any]:
+    tool_name, tool_args, _ = _rule_based_planner_cached(user_input)
+    return {"tool_name": tool_name, "tool_args": dict(tool_args) if tool_args is not None else None}
+
+
+# Deterministic and pure, so results are memoized per exact message. Entries are immutable
+# (args as key/value pairs) and the third field says whether the plan is clear enough for the
+# fast path: exactly one tool intent fired and a topic phrase could be extracted.
+@lru_cache(maxsize=4096)
+def _rule_based_planner_cached(
+    user_input: str,
+) -> Tuple[Optional[str], Optional[Tuple[Tuple[str, Any], ...]], bool]:
     s = user_input.lower()
+    fired = _scan_intents(s)
+    topic = _extract_topic(user_input)
+    plan = _rule_plan(topic or user_input, s, fired)
+    tool_args = plan["tool_args"]
+    return (
+        plan["tool_name"],
+        tuple(tool_args.items()) if tool_args is not None else None,
+        len(fired & _TOOL_INTENTS) == 1 and topic is not None,
+    )
+
+
+def _note_args(topic: str, s: str, fired: Set[str]) -> Dict[str, Any]:
+    return {
+        "topic": topic,
+        "note_taking_style": "structured",
+        "subject": MOCK_STUDENT_CONTEXT.get("subject", "General"),
+        "include_examples": True,
+        "include_analogies": "conf" in fired,
+    }
+
+
+def _flashcard_args(topic: str, s: str, fired: Set[str]) -> Dict[str, Any]:
+    count = 5
+    m = _COUNT_RE.search(s)
+    if m:
+        count = int(m.group(1))
+    return {
+        "topic": topic,
+        "count": max(1, min(count, 20)),
+        "difficulty": "medium",
+        "subject": MOCK_STUDENT_CONTEXT.get("subject", "General"),
+    }
+
+
+def _explainer_args(topic: str, s: str, fired: Set[str]) -> Dict[str, Any]:
+    depth = "intermediate"
+    if "basic" in fired:
+        depth = "basic"
+    if "adv" in fired:
+        depth = "advanced"
+    return {
+        "concept_to_explain": topic,
+        "desired_depth": depth,
+        "current_topic": MOCK_STUDENT_CONTEXT.get("last_topic", "General"),
+    }
+
+
+_RULE_ARG_BUILDERS: Dict[str, Callable[[str, str, Set[str]], Dict[str, Any]]] = {
+    "note_maker": _note_args,
+    "flashcard_generator": _flashcard_args,
+    "concept_explainer": _explainer_args,
+}
+
+# Tool intent → tool, in priority order
+_INTENT_TOOLS: Tuple[Tuple[str, str], ...] = (
+    ("note", "note_maker"),
+    ("card", "flashcard_generator"),
+    ("explain", "concept_explainer"),
+)
 
-    if any(k in s for k in ["note", "summary", "outline", "study"]):
-        return {
-            "tool_name": "note_maker",
-            "tool_args": {
-                "topic": user_input,
-                "note_taking_style": "structured",
-                "subject": MOCK_STUDENT_CONTEXT.get("subject", "General"),
-                "include_examples": True,
-                "include_analogies": "confuse" in s or "confused" in s,
-            },
-        }
-
-    if any(k in s for k in ["flashcard", "quiz", "practice"]):
-        count = 5
-        m = re.search(r"\b(\d{1,2})\b", s)
-        if m:
-            count = int(m.group(1))
-        return {
-            "tool_name": "flashcard_generator",
-            "tool_args": {
-                "topic": user_input,
-                "count": max(1, min(count, 20)),
-                "difficulty": "medium",
-                "subject": MOCK_STUDENT_CONTEXT.get("subject", "General"),
-            },
-        }
-
-    if any(k in s for k in ["explain", "define", "describe", "clarify"]):
-        depth = "intermediate"
-        if "simple" in s or "basic" in s:
-            depth = "basic"
-        if "advanced" in s or "detailed" in s:
-            depth = "advanced"
-        return {
-            "tool_name": "concept_explainer",
-            "tool_args": {
-                "concept_to_explain": user_input,
-                "desired_depth": depth,
-                "current_topic": MOCK_STUDENT_CONTEXT.get("last_topic", "General"),
-            },
-        }
 
+def _rule_plan(topic: str, s: str, fired: Set[str]) -> Dict[str, Any]:
+    for intent, tool_name in _INTENT_TOOLS:
+        if intent in fired:
+            return {"tool_name": tool_name, "tool_args": _RULE_ARG_BUILDERS[tool_name](topic, s, fired)}
     return {"tool_name": None, "tool_args": None}
 
 
+def _rule_tool_args(tool_name: str, user_input: str) -> Dict[str, Any]:
+    """Rule-derived args for a given tool, whichever intent the message's keywords point at."""
+    s = user_input.lower()
+    return _RULE_ARG_BUILDERS[tool_name](_extract_topic(user_input) or user_input, s, _scan_intents(s))
+
+
 # ---------------------------------------------
 # Planner Node
 # ---------------------------------------------
+# Opt-in (ORCH_RULE_FAST_PATH=1): messages with exactly one tool keyword and a clear topic phrase
+# are planned by the rules and skip the LLM. Subject/current_topic then come from the student
+# context rather than the message, so by default every message is planned by Gemini.
+ORCH_RULE_FAST_PATH = os.getenv("ORCH_RULE_FAST_PATH") == "1"
+
+# The raw tool call is only kept in state when debugging
+# (globally via ORCH_DEBUG_RAW=1, or per request via debug=True)
+ORCH_DEBUG_RAW = os.getenv("ORCH_DEBUG_RAW") == "1"
+
+
+def _plan_from_tool_call(state: OrchestratorState, tool_call: ToolCall) -> OrchestratorState:
+    if ORCH_DEBUG_RAW or state.get("debug"):
+        state["llm_raw"] = str(tool_call)
+    state["tool_name"] = tool_call["name"]
+    # Gemini function-call args arrive as protobuf Struct numbers (floats); restore ints like count=10
+    state["tool_args"] = {
+        k: int(v) if isinstance(v, float) and v.is_integer() else v
+        for k, v in tool_call["args"].items()
+    }
+    state["status"] = "FOUND_TOOL"
+    return state
+
+
+def _plan_with_fallback(state: OrchestratorState, error: Exception) -> OrchestratorState:
+    """Fill the planner fields from the rule-based planner after an LLM failure."""
+    logger.warning("[Planner] ⚠️ Falling back due to error: %s", error)
+    fb = rule_based_planner(state.get("user_message", ""))
+    state["tool_name"] = fb.get("tool_name")
+    state["tool_args"] = fb.get("tool_args")
+    state["fallback_used"] = True
+    state["status"] = "FOUND_TOOL" if fb.get("tool_name") else "NO_TOOL"
+    state["error"] = str(error)
+    return state
+
+
+def _plan_from_rules(state: OrchestratorState, user_input: str) -> bool:
+    """Fill the planner fields from the rules if the message is clear enough for the fast path; returns False otherwise."""
+    tool_name, tool_args, unambiguous = _rule_based_planner_cached(user_input)
+    state["fast_path"] = unambiguous
+    if not unambiguous:
+        return False
+    state["tool_name"] = tool_name
+    state["tool_args"] = dict(tool_args)
+    state["status"] = "FOUND_TOOL"
+    return True
+
+
+def _plan_from_cache(state: OrchestratorState, hit: Optional[Tuple[str, Dict[str, Any]]]) -> bool:
+    """Fill the planner fields from a plan cache lookup; returns False on a miss."""
+    state["cache_hit"] = hit is not None
+    if hit is None:
+        return False
+    state["tool_name"], state["tool_args"] = hit
+    state["status"] = "FOUND_TOOL"
+    return True
+
+
+def _is_cacheable_plan(state: OrchestratorState) -> bool:
+    """Only cache an LLM plan if its tool accepts the args, so a rejected plan is re-asked next time.
+    (Checks like the flashcard count range live in validators, not in the schema Gemini sees.)"""
+    tool = TOOL_MAP.get(state["tool_name"])
+    if tool is None:
+        return False
+    try:
+        tool.args_schema.model_validate(state["tool_args"])
+    except ValueError as e:
+        logger.info("[PlanCache] Not caching invalid %s plan: %s", state["tool_name"], e)
+        return False
+    return True
+
+
 def planner_node(state: OrchestratorState) -> OrchestratorState:
-    """Planner node that first tries LLM (Gemini) → then falls back to rule-based planner if needed."""
+    """Planner node: unambiguous rules → plan cache → LLM (Gemini) → rule-based planner fallback if needed."""
     user_input = state.get("user_message", "")
     state["fallback_used"] = False
 
-    try:
-        result = _agent_executor.invoke({"input": user_input})
-        state["llm_raw"] = str(result)
-
-        # --- Extract the raw text from LLM output ---
-        output = result.get("output") or result
-
-        # If output is a string, Gemini may wrap JSON in ```json ... ```
-        if isinstance(output, str):
-            import re, json
-
-            # Clean out markdown code fences
-            clean_output = re.sub(r"```(?:json)?", "", output, flags=re.IGNORECASE)
-            clean_output = clean_output.replace("```", "").strip()
-
-            # Try parsing JSON if possible
-            try:
-                parsed = json.loads(clean_output)
-                name = parsed.get("tool_name") or parsed.get("tool") or parsed.get("name")
-                args = (
-                    parsed.get("tool_args")
-                    or parsed.get("args")
-                    or parsed.get("tool_input")
-                    or parsed.get("parameters")  # ✅ Gemini sometimes uses this key
-                    or {}
-                )
-                if name:
-                    state["tool_name"] = name
-                    state["tool_args"] = args
-                    state["status"] = "FOUND_TOOL"
-                    return state
-            except Exception:
-                pass  # fall through to other parsing methods
-
-        # If still a dict, use the direct extraction path
-        if isinstance(output, dict):
-            name = output.get("name") or output.get("tool_name")
-            args = (
-                output.get("args")
-                or output.get("tool_args")
-                or output.get("tool_input")
-                or output.get("parameters")
-                or {}
-            )
-            if name:
-                state["tool_name"] = name
-                state["tool_args"] = args
-                state["status"] = "FOUND_TOOL"
-                return state
+    if ORCH_RULE_FAST_PATH and _plan_from_rules(state, user_input):
+        return state
 
-        # If we reach here, the LLM didn’t provide a structured tool call
-        raise ValueError("LLM failed to produce structured tool call.")
+    cache_key = _normalize_message(user_input)
+    if _plan_from_cache(state, _plan_cache_get(cache_key, user_input)):
+        return state
 
+    try:
+        response = structured_llm.invoke(_single_call_messages(user_input))
+        if not response.tool_calls:
+            raise ValueError("LLM failed to produce structured tool call.")
+        _plan_from_tool_call(state, response.tool_calls[0])
+        if _is_cacheable_plan(state):
+            _plan_cache_put(cache_key, state["tool_name"], state["tool_args"])
+        return state
     except Exception as e:
-        print(f"[Planner] ⚠️ Falling back due to error: {e}")
-        fb = rule_based_planner(user_input)
-        state["tool_name"] = fb.get("tool_name")
-        state["tool_args"] = fb.get("tool_args")
-        state["fallback_used"] = True
-        state["status"] = "FOUND_TOOL" if fb.get("tool_name") else "NO_TOOL"
-        state["error"] = str(e)
+        return _plan_with_fallback(state, e)
+
+
+async def aplanner_node(state: OrchestratorState) -> OrchestratorState:
+    """Async twin of planner_node — with ORCH_PLANNER_BATCH=1, coalesces concurrent requests into batched Gemini calls."""
+    user_input = state.get("user_message", "")
+    state["fallback_used"] = False
+
+    if ORCH_RULE_FAST_PATH and _plan_from_rules(state, user_input):
         return state
 
+    cache_key = _normalize_message(user_input)
+    if _plan_from_cache(state, await _aplan_cache_get(cache_key, user_input)):
+        return state
+
+    try:
+        if ORCH_PLANNER_BATCH:
+            tool_call = await planner_batcher.submit(user_input)
+        else:
+            response = await structured_llm.ainvoke(_single_call_messages(user_input))
+            if not response.tool_calls:
+                raise ValueError("LLM failed to produce structured tool call.")
+            tool_call = response.tool_calls[0]
+        _plan_from_tool_call(state, tool_call)
+        if _is_cacheable_plan(state):
+            await _aplan_cache_put(cache_key, state["tool_name"], state["tool_args"])
+        return state
+    except Exception as e:
+        return _plan_with_fallback(state, e)
 
 
 # ---------------------------------------------
 # Executor Node (✅ fixed .invoke() call)
 # ---------------------------------------------
-def executor_node(state: OrchestratorState) -> OrchestratorState:
+def _resolve_tool(state: OrchestratorState) -> Optional[Any]:
+    """Look up the planned tool; sets NO_TOOL / UNKNOWN_TOOL and returns None if there isn't one."""
     name = state.get("tool_name")
-    args = state.get("tool_args") or {}
 
     if not name:
         state["status"] = "NO_TOOL"
         state["final_response"] = "⚠️ Unable to determine a suitable tool."
-        return state
+        return None
 
     tool_func = TOOL_MAP.get(name)
     if not tool_func:
         state["status"] = "UNKNOWN_TOOL"
         state["final_response"] = f"❌ Unknown tool: {name}"
+        return None
+    return tool_func
+
+
+def _record_tool_success(state: OrchestratorState, result: Any) -> OrchestratorState:
+    state["tool_output"] = result
+    state["status"] = "TOOL_SUCCESS"
+    logger.info("[Executor] ✅ %s executed successfully.", state["tool_name"])
+    return state
+
+
+def _record_tool_error(state: OrchestratorState, error: Exception) -> OrchestratorState:
+    state["status"] = "TOOL_ERROR"
+    state["error"] = str(error)
+    state["final_response"] = f"❌ Tool execution failed: {error}"
+    logger.warning("[Executor] ❌ Tool failed: %s", error)
+    return state
+
+
+def executor_node(state: OrchestratorState) -> OrchestratorState:
+    tool_func = _resolve_tool(state)
+    if tool_func is None:
         return state
 
     try:
         # ✅ FIXED: LangChain tools use .invoke(dict)
-        result = tool_func.invoke(args)
-        state["tool_output"] = result
-        state["status"] = "TOOL_SUCCESS"
-        print(f"[Executor] ✅ {name} executed successfully.")
+        result = tool_func.invoke(state.get("tool_args") or {})
     except Exception as e:
-        state["status"] = "TOOL_ERROR"
-        state["error"] = str(e)
-        state["final_response"] = f"❌ Tool execution failed: {e}"
-        print(f"[Executor] ❌ Tool failed: {e}")
-    return state
+        return _record_tool_error(state, e)
+    return _record_tool_success(state, result)
+
+
+async def aexecutor_node(state: OrchestratorState) -> OrchestratorState:
+    """Async twin of executor_node — sync tools run in a worker thread, async tools are awaited natively."""
+    tool_func = _resolve_tool(state)
+    if tool_func is None:
+        return state
+
+    try:
+        result = await tool_func.ainvoke(state.get("tool_args") or {})
+    except Exception as e:
+        return _record_tool_error(state, e)
+    return _record_tool_success(state, result)
 
 
 # ---------------------------------------------
 # Formatter Node
 # ---------------------------------------------
+# Tool name → tutor reply built from the tool args; add an entry alongside each new tool
+_FORMATTERS: Dict[str, Callable[[Dict[str, Any]], str]] = {
+    "note_maker": lambda a: f"📘 Here are your **{a.get('topic', 'your topic')}** notes (structured). Ready to start?",
+    "flashcard_generator": lambda a: f"🃏 Generated {a.get('count', 5)} flashcards on {a.get('topic', 'this topic')}.",
+    "concept_explainer": lambda a: f"🧠 Explanation for **{a.get('concept_to_explain', 'the concept')}** ready!",
+}
+
+
 def formatter_node(state: OrchestratorState) -> OrchestratorState:
     status = state.get("status")
 
     if status == "TOOL_SUCCESS":
         name = state["tool_name"]
-        args = state.get("tool_args", {})
-        if name == "note_maker":
-            topic = args.get("topic", "your topic")
-            msg = f"📘 Here are your **{topic}** notes (structured). Ready to start?"
-        elif name == "flashcard_generator":
-            msg = f"🃏 Generated {args.get('count', 5)} flashcards on {args.get('topic', 'this topic')}."
-        elif name == "concept_explainer":
-            msg = f"🧠 Explanation for **{args.get('concept_to_explain', 'the concept')}** ready!"
-        else:
+        fmt = _FORMATTERS.get(name)
+        if fmt is None:
             msg = f"✅ Tool {name} executed successfully."
+        else:
+            msg = fmt(state.get("tool_args") or {})
         state["final_response"] = msg
         state["status"] = "SUCCESS"
         return state
@@ -270,13 +723,21 @@ def formatter_node(state: OrchestratorState) -> OrchestratorState:
     return state
 
 
+async def aformatter_node(state: OrchestratorState) -> OrchestratorState:
+    # Pure string formatting — run inline rather than hopping to the default thread pool
+    return formatter_node(state)
+
+
 # ---------------------------------------------
 # Build LangGraph
 # ---------------------------------------------
 graph = StateGraph(OrchestratorState)
-graph.add_node("planner", planner_node)
-graph.add_node("executor", executor_node)
-graph.add_node("formatter", formatter_node)
+# RunnableCallable (sync + async node) avoids RunnableLambda's per-invoke source parsing in
+# dumpd(graph). It is LangGraph-internal and relies on the exact langgraph==0.1.6 pin —
+# re-check this import (or fall back to RunnableLambda) when upgrading LangGraph.
+graph.add_node("planner", RunnableCallable(planner_node, aplanner_node))
+graph.add_node("executor", RunnableCallable(executor_node, aexecutor_node))
+graph.add_node("formatter", RunnableCallable(formatter_node, aformatter_node))
 graph.add_edge("planner", "executor")
 graph.add_edge("executor", "formatter")
 graph.set_entry_point("planner")
@@ -285,19 +746,49 @@ orchestrator_graph = graph.compile()
 
 
 # ---------------------------------------------
-# Public Entrypoint
+# Public Entrypoints
 # ---------------------------------------------
-def run_orchestrator_turn(user_message: str) -> Dict[str, Any]:
-    initial_state = {"user_message": user_message}
-    final = orchestrator_graph.invoke(initial_state)
-
-    return {
+def _build_response(final: Dict[str, Any], debug: bool = False) -> Dict[str, Any]:
+    response = {
         "status": final.get("status"),
         "final_response": final.get("final_response"),
         "tool_name": final.get("tool_name"),
         "tool_args": final.get("tool_args"),
-        "raw_state": final,
-        "llm_raw": final.get("llm_raw"),
         "fallback_used": final.get("fallback_used", False),
+        "cache_hit": final.get("cache_hit", False),
+        "fast_path": final.get("fast_path", False),
         "error": final.get("error"),
     }
+    # Full graph state and raw LLM output are large; only return them when debugging
+    if debug:
+        response["raw_state"] = final
+        response["llm_raw"] = final.get("llm_raw")
+    return response
+
+
+def run_orchestrator_turn(user_message: str, debug: bool = False) -> Dict[str, Any]:
+    initial_state = {"user_message": user_message, "debug": debug}
+    final = orchestrator_graph.invoke(initial_state)
+    return _build_response(final, debug)
+
+
+async def arun_orchestrator_turn(user_message: str, debug: bool = False) -> Dict[str, Any]:
+    """Async entrypoint — lets concurrent requests overlap their Gemini round-trips."""
+    initial_state = {"user_message": user_message, "debug": debug}
+    final = await orchestrator_graph.ainvoke(initial_state)
+    return _build_response(final, debug)
+
+
+async def awarm_up(timeout: float = 10.0) -> bool:
+    """Fire one dummy planner request straight at Gemini so the connection, auth token and
+    tool declarations are hot before real traffic. Skips the rule fast path, plan cache and
+    graph state; failures are logged, never raised. Returns True if the call succeeded."""
+    try:
+        await asyncio.wait_for(
+            structured_llm.ainvoke(_single_call_messages("explain photosynthesis")),
+            timeout,
+        )
+        return True
+    except Exception as e:
+        logger.warning("[Warmup] ⚠️ Gemini warm-up failed: %r", e)
+        return False
@@ -1,8 +1,25 @@
+import asyncio
+import json
+import re
+import threading
+from types import SimpleNamespace
+
+import pytest
 from fastapi.testclient import TestClient
-from main import app
+from main import MAX_MESSAGE_LENGTH, app
+import orchestrator_graph
+from orchestrator_graph import SINGLE_CALL_SUFFIX, PlannerBatcher, rule_based_planner
 
 client = TestClient(app)
 
+@pytest.fixture(autouse=True)
+def clear_planner_caches():
+    """Every test starts with an empty plan cache and rule-planner memo."""
+    with orchestrator_graph._plan_cache_lock:
+        orchestrator_graph._plan_cache.clear()
+    orchestrator_graph._rule_based_planner_cached.cache_clear()
+    yield
+
 def test_health_check():
     response = client.get("/")
     assert response.status_code == 200
@@ -10,8 +27,229 @@ def test_health_check():
 
 def test_orchestrate_notes():
     message = "Generate structured notes on protein synthesis and include examples."
-    response = client.post(f"/api/orchestrate?message={message}")
+    response = client.post("/api/orchestrate", json={"message": message})
     data = response.json()
     assert response.status_code == 200
     assert data["status"] in ["SUCCESS", "FOUND_TOOL"]
     assert "note_maker" in data["tool_name"]
+    assert "raw_state" not in data
+
+def test_orchestrate_rejects_overlong_message():
+    response = client.post("/api/orchestrate", json={"message": "x" * (MAX_MESSAGE_LENGTH + 1)})
+    assert response.status_code == 422
+
+def test_orchestrate_debug_includes_raw_state():
+    message = "Make 5 flashcards on cell division"
+    response = client.post("/api/orchestrate?debug=1", json={"message": message})
+    data = response.json()
+    assert response.status_code == 200
+    assert data["raw_state"]["user_message"] == message
+    assert "llm_raw" in data
+
+class FakePlannerModel:
+    """Answers each planned message with a concept_explainer call echoing its text and index."""
+
+    def __init__(self, reverse_batches=False, batch_index=None):
+        self.reverse_batches = reverse_batches
+        self.batch_index = batch_index
+        self.prompts = []
+
+    async def ainvoke(self, messages):
+        prompt = messages[-1].content
+        self.prompts.append(prompt)
+        if prompt.startswith(SINGLE_CALL_SUFFIX):
+            planned = [(1, prompt[len(SINGLE_CALL_SUFFIX):])]
+        else:
+            planned = [
+                (int(line.split(". ", 1)[0]), json.loads(line.split(". ", 1)[1]))
+                for line in prompt.splitlines() if re.match(r"\d+\. ", line)
+            ]
+            if self.reverse_batches:
+                planned.reverse()
+            if self.batch_index is not None:
+                planned = [(self.batch_index, m) for _, m in planned]
+        return SimpleNamespace(tool_calls=[
+            {"name": "concept_explainer", "args": self._args(i, m), "id": None} for i, m in planned
+        ])
+
+    @staticmethod
+    def _args(index, message):
+        concept, _, depth = message.removeprefix("explain ").partition(" ")
+        return {
+            "concept_to_explain": concept,
+            "desired_depth": "advanced" if depth == "in depth" else "basic",
+            "message_index": float(index),
+        }
+
+def _plan_concurrently(batcher, messages):
+    async def run():
+        return await asyncio.gather(*[batcher.submit(m) for m in messages])
+    return asyncio.run(run())
+
+def test_planner_batcher_coalesces_concurrent_messages():
+    model = FakePlannerModel()
+    batcher = PlannerBatcher(model, max_batch=8, max_wait=0.05)
+    messages = [f"explain topic{i}" for i in range(5)]
+
+    results = _plan_concurrently(batcher, messages)
+    assert len(model.prompts) == 1
+    assert [r["args"]["concept_to_explain"] for r in results] == [f"topic{i}" for i in range(5)]
+    assert all("message_index" not in r["args"] for r in results)
+
+def test_planner_batcher_routes_reordered_calls_by_message_index():
+    model = FakePlannerModel(reverse_batches=True)
+    batcher = PlannerBatcher(model, max_batch=8, max_wait=0.05)
+    # Same topic: only the non-text desired_depth tells the two plans apart
+    messages = ["explain entropy simply", "explain entropy in depth"]
+
+    results = _plan_concurrently(batcher, messages)
+    assert [r["args"]["desired_depth"] for r in results] == ["basic", "advanced"]
+    assert len(model.prompts) == 1
+
+def test_planner_batcher_replans_messages_without_exactly_one_call():
+    model = FakePlannerModel(batch_index=1)
+    batcher = PlannerBatcher(model, max_batch=8, max_wait=0.05)
+    messages = ["explain mitosis", "explain osmosis"]
+
+    results = _plan_concurrently(batcher, messages)
+    assert [r["args"]["concept_to_explain"] for r in results] == ["mitosis", "osmosis"]
+    # Both calls claimed message 1, so each message is re-planned on its own
+    assert len(model.prompts) == 3
+
+
+def test_rule_based_planner_intents():
+    notes = rule_based_planner("Summary of photosynthesis please, I'm confused")
+    assert notes["tool_name"] == "note_maker"
+    assert notes["tool_args"]["include_analogies"] is True
+
+    cards = rule_based_planner("Make 12 FLASHCARDS on Newton's laws")
+    assert cards["tool_name"] == "flashcard_generator"
+    assert cards["tool_args"]["count"] == 12
+
+    explain = rule_based_planner("Explain entropy in simple terms")
+    assert explain["tool_name"] == "concept_explainer"
+    assert explain["tool_args"]["desired_depth"] == "basic"
+
+    assert rule_based_planner("hello there")["tool_name"] is None
+
+def test_planner_does_not_cache_args_the_tool_rejects(monkeypatch):
+    counts = iter([50, 10])
+
+    class FakeSyncModel:
+        def invoke(self, messages):
+            args = {"topic": "gravity waves", "count": next(counts), "difficulty": "easy", "subject": "Physics"}
+            return SimpleNamespace(tool_calls=[{"name": "flashcard_generator", "args": args, "id": None}])
+
+    monkeypatch.setattr(orchestrator_graph, "structured_llm", FakeSyncModel())
+    message = "gravity waves, lots of cards"
+    key = orchestrator_graph._normalize_message(message)
+
+    orchestrator_graph.planner_node({"user_message": message})
+    assert orchestrator_graph._plan_cache_get(key, message) is None
+
+    state = orchestrator_graph.planner_node({"user_message": message})
+    assert state["cache_hit"] is False
+    assert orchestrator_graph._plan_cache_get(key, message)[1]["count"] == 10
+
+def test_semantic_cache_hit_reuses_only_the_tool_choice(monkeypatch):
+    stored = {}
+    fake_semantic = SimpleNamespace(
+        put=lambda key, answer: stored.setdefault("answer", answer),
+        get=lambda key: stored.get("answer"),
+    )
+    monkeypatch.setattr(orchestrator_graph, "_semantic_cache", fake_semantic)
+
+    args = {"concept_to_explain": "mitosis", "desired_depth": "advanced", "current_topic": "Cells"}
+    orchestrator_graph._plan_cache_put("tell me about mitosis in detail", "concept_explainer", args)
+
+    message = "Tell me about meiosis in simple terms"
+    name, hit_args = orchestrator_graph._plan_cache_get(orchestrator_graph._normalize_message(message), message)
+    assert name == "concept_explainer"
+    assert hit_args == {
+        "concept_to_explain": "meiosis",
+        "desired_depth": "basic",
+        "current_topic": orchestrator_graph.MOCK_STUDENT_CONTEXT["last_topic"],
+    }
+
+def test_async_planner_runs_semantic_cache_off_the_event_loop(monkeypatch):
+    threads = []
+    fake_semantic = SimpleNamespace(
+        get=lambda key: threads.append(threading.current_thread()),
+        put=lambda key, answer: threads.append(threading.current_thread()),
+    )
+    monkeypatch.setattr(orchestrator_graph, "_semantic_cache", fake_semantic)
+
+    class FakeAsyncModel:
+        async def ainvoke(self, messages):
+            args = {"concept_to_explain": "tides", "desired_depth": "basic", "current_topic": "Earth"}
+            return SimpleNamespace(tool_calls=[{"name": "concept_explainer", "args": args, "id": None}])
+
+    monkeypatch.setattr(orchestrator_graph, "structured_llm", FakeAsyncModel())
+    state = asyncio.run(orchestrator_graph.aplanner_node({"user_message": "why do tides happen"}))
+    assert state["tool_name"] == "concept_explainer"
+    assert len(threads) == 2
+    assert all(t is not threading.main_thread() for t in threads)
+
+def test_rule_based_planner_extracts_topic_and_count():
+    cards = rule_based_planner("Make 3 flashcards on osmosis")["tool_args"]
+    assert (cards["topic"], cards["count"]) == ("osmosis", 3)
+
+    quiz = rule_based_planner("Quiz me on World War 2")["tool_args"]
+    assert (quiz["topic"], quiz["count"]) == ("World War 2", 5)
+
+    practice = rule_based_planner("Give me 10 practice questions about supply and demand")["tool_args"]
+    assert (practice["topic"], practice["count"]) == ("supply and demand", 10)
+
+    osi = rule_based_planner("Can you explain the 7 layers of the OSI model")["tool_args"]
+    assert osi["concept_to_explain"] == "the 7 layers of the OSI model"
+
+    notes = rule_based_planner("Generate structured notes on protein synthesis and include examples.")["tool_args"]
+    assert notes["topic"] == "protein synthesis"
+
+def test_plan_from_rules_takes_fast_path_only_for_one_intent_with_a_topic():
+    state = {}
+    assert orchestrator_graph._plan_from_rules(state, "Make 3 flashcards on osmosis") is True
+    assert state["fast_path"] is True
+    assert state["tool_name"] == "flashcard_generator"
+    assert state["tool_args"]["topic"] == "osmosis"
+
+    state = {}
+    assert orchestrator_graph._plan_from_rules(state, "quiz me and explain osmosis") is False
+    assert state["fast_path"] is False
+    assert "tool_name" not in state
+
+    state = {}
+    assert orchestrator_graph._plan_from_rules(state, "I want to practice more") is False
+    assert "tool_name" not in state
+
+def test_ambiguous_message_goes_to_llm_then_hits_plan_cache(monkeypatch):
+    calls = []
+
+    class FakeSyncModel:
+        def invoke(self, messages):
+            calls.append(messages[-1].content)
+            args = {"concept_to_explain": "osmosis", "desired_depth": "basic", "current_topic": "Cells"}
+            return SimpleNamespace(tool_calls=[{"name": "concept_explainer", "args": args, "id": None}])
+
+    monkeypatch.setattr(orchestrator_graph, "structured_llm", FakeSyncModel())
+    monkeypatch.setattr(orchestrator_graph, "ORCH_RULE_FAST_PATH", True)
+    message = "Quiz me and explain osmosis"
+
+    first = orchestrator_graph.run_orchestrator_turn(message)
+    assert (first["fast_path"], first["cache_hit"]) == (False, False)
+    assert first["tool_name"] == "concept_explainer"
+
+    second = orchestrator_graph.run_orchestrator_turn("  quiz me AND explain osmosis ")
+    assert (second["fast_path"], second["cache_hit"]) == (False, True)
+    assert second["tool_args"] == first["tool_args"]
+    assert len(calls) == 1
+
+def test_plan_cache_round_trip_returns_fresh_dicts():
+    args = {"topic": "enzymes", "count": 4, "difficulty": "easy", "subject": "Biology"}
+    orchestrator_graph._plan_cache_put("cards on enzymes", "flashcard_generator", args)
+    args["count"] = 99
+
+    name, hit = orchestrator_graph._plan_cache_get("cards on enzymes", "cards on enzymes")
+    assert (name, hit["count"]) == ("flashcard_generator", 4)
+    hit["count"] = 7
+    assert orchestrator_graph._plan_cache_get("cards on enzymes", "cards on enzymes")[1]["count"] == 4
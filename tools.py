@@ -1,7 +1,7 @@
 
 from langchain_core.tools import tool
 from typing import Dict, Any
-from pydantic import BaseModel, Field, validator
+from pydantic import BaseModel, Field, field_validator
 from enum import Enum
 
 # ---------- ENUMS ----------
@@ -26,6 +26,8 @@ class ExplanationDepthEnum(str, Enum):
 
 
 # ---------- INPUT SCHEMAS ----------
+MAX_FLASHCARDS = 20
+
 class NoteMakerInput(BaseModel):
     topic: str
     note_taking_style: NoteStyleEnum
@@ -40,10 +42,11 @@ class FlashcardGeneratorInput(BaseModel):
     difficulty: FlashcardDifficultyEnum
     subject: str
 
-    @validator("count")
+    @field_validator("count")
+    @classmethod
     def validate_count(cls, v):
-        if not 1 <= v <= 20:
-            raise ValueError("Count must be between 1 and 20")
+        if not 1 <= v <= MAX_FLASHCARDS:
+            raise ValueError(f"Count must be between 1 and {MAX_FLASHCARDS}")
         return v
 
 
@@ -54,40 +57,53 @@ class ConceptExplainerInput(BaseModel):
 
 
 # ---------- TOOL FUNCTIONS ----------
+# Topic-independent flashcard text for every allowed count, built once at import
+_FLASHCARD_Q_PREFIXES = tuple(f"What is point {i} about " for i in range(1, MAX_FLASHCARDS + 1))
+_FLASHCARD_ANSWERS = tuple(f"Answer {i}." for i in range(1, MAX_FLASHCARDS + 1))
+
+# LangChain validates the input against `args_schema` before calling the function,
+# so the tools take the validated fields directly (defaults mirror the schemas).
 @tool("note_maker", args_schema=NoteMakerInput)
-def note_maker_tool(**kwargs) -> Dict[str, Any]:
+def note_maker_tool(
+    topic: str,
+    note_taking_style: NoteStyleEnum,
+    subject: str,
+    include_examples: bool = True,
+    include_analogies: bool = False,
+) -> Dict[str, Any]:
     """Generates structured study notes."""
-    data = NoteMakerInput(**kwargs)
     return {
         "result": {
-            "topic": data.topic,
-            "style": data.note_taking_style,
-            "examples": data.include_examples,
-            "analogies": data.include_analogies,
+            "topic": topic,
+            "style": note_taking_style,
+            "examples": include_examples,
+            "analogies": include_analogies,
         }
     }
 
 
 @tool("flashcard_generator", args_schema=FlashcardGeneratorInput)
-def flashcard_generator_tool(**kwargs) -> Dict[str, Any]:
+def flashcard_generator_tool(
+    topic: str, count: int, difficulty: FlashcardDifficultyEnum, subject: str
+) -> Dict[str, Any]:
     """Generates flashcards for a topic."""
-    data = FlashcardGeneratorInput(**kwargs)
     flashcards = [
-        {"q": f"What is point {i} about {data.topic}?", "a": f"Answer {i}."}
-        for i in range(1, data.count + 1)
+        {"q": prefix + topic + "?", "a": answer}
+        for prefix, answer in zip(_FLASHCARD_Q_PREFIXES[:count], _FLASHCARD_ANSWERS)
     ]
-    return {"result": {"flashcards": flashcards, "difficulty": data.difficulty}}
+    return {"result": {"flashcards": flashcards, "difficulty": difficulty}}
 
 
 @tool("concept_explainer", args_schema=ConceptExplainerInput)
-def concept_explainer_tool(**kwargs) -> Dict[str, Any]:
+def concept_explainer_tool(
+    concept_to_explain: str, desired_depth: ExplanationDepthEnum, current_topic: str
+) -> Dict[str, Any]:
     """Explains a concept with desired depth."""
-    data = ConceptExplainerInput(**kwargs)
     return {
         "result": {
-            "concept": data.concept_to_explain,
-            "depth": data.desired_depth,
-            "explanation": f"{data.desired_depth.value.title()} explanation of {data.concept_to_explain}.",
+            "concept": concept_to_explain,
+            "depth": desired_depth,
+            "explanation": f"{desired_depth.value.title()} explanation of {concept_to_explain}.",
         }
     }
 